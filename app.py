@@ -1,15 +1,28 @@
 # Run this app with `python app.py` and
 # visit http://127.0.0.1:8050/ in your web browser.
 import argparse
+import json
+import math
+import os
 from datetime import datetime
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.utils
 import time
 from dash import Dash, html, dcc, Input, Output, State
 from dash.exceptions import PreventUpdate
 from lib.data_processing import DataProcessing
 from lib import data_loader
 import dash_bootstrap_components as dbc
+from dotenv import load_dotenv
+from flask import Response
+
+# ------------------Frame Budget----------------------
+# The animation interval is coarsened automatically when the number of frames or the
+# estimated size of the figure would exceed these limits (0 disables a limit).
+load_dotenv()
+max_frames = int(os.getenv('MAX_FRAMES', 120))
+max_payload_bytes = int(os.getenv('MAX_PAYLOAD_BYTES', 20 * 1024 * 1024))
 
 # ------------------Retrieve Data---------------------
 while True:
@@ -37,18 +50,53 @@ while True:
         if time_interval < 1:
             raise ValueError
 
-        # data folder containing the data
+        # optional comparison window, shifted back by the given hours (e.g. 24 for the same hours yesterday)
+        compare_offset = input("Enter comparison offset (in hours, leave empty for none):").strip()
+        compare_offset = int(compare_offset) if compare_offset else 0
+        if compare_offset < 0:
+            raise ValueError
+        compare_start_timestamp = start_timestamp - compare_offset * 60 * 60 * 1000
+        compare_end_timestamp = end_timestamp - compare_offset * 60 * 60 * 1000
+
+        # data folder containing the data, or an S3-compatible bucket if DATA_URL is set
         dir_name = './data/'
-        raw_data = data_loader.get_data(dir_name, start_timestamp, end_timestamp)
+        data_source = dir_name
+        if os.getenv('DATA_URL'):
+            data_source = data_loader.ObjectStoreSource(os.getenv('DATA_URL'),
+                                                        max_in_flight=int(os.getenv('DATA_MAX_IN_FLIGHT', 8)),
+                                                        retries=int(os.getenv('DATA_RETRIES', 3)),
+                                                        cache_dir=os.getenv('DATA_CACHE_DIR'),
+                                                        file_span=int(os.getenv('DATA_FILE_SPAN', 0)) * 60 * 60 * 1000,
+                                                        access_key=os.getenv('AWS_ACCESS_KEY_ID'),
+                                                        secret_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                                                        session_token=os.getenv('AWS_SESSION_TOKEN'),
+                                                        region=os.getenv('AWS_REGION', 'us-east-1'))
+        # only the data of the two windows is loaded, and files shared by the windows are only read once
+        windows = [(start_timestamp, end_timestamp)]
+        if compare_offset:
+            windows.append((compare_start_timestamp, compare_end_timestamp))
+        raw_data = data_loader.get_windows_data(data_source, windows)
 
         status_list = []
         timestamp_list = []
+        current_stats = None
+        compare_stats = None
 
-        if len(raw_data) != 0:
-            data_process = DataProcessing(raw_data, time_interval, start_timestamp, end_timestamp)
+        data_process = DataProcessing(raw_data, time_interval, start_timestamp, end_timestamp,
+                                      extra_windows=windows[1:])
+
+        # the loaded data can belong to the comparison window only
+        if len(raw_data) != 0 and not data_process.get_window_data(start_timestamp, end_timestamp).empty:
             df = data_process.get_aggregated_data
             status_list = df['status_code'].unique().tolist()
             timestamp_list = df['ts'].unique().tolist()
+
+            if compare_offset:
+                current_stats = data_process.get_window_statistics(start_timestamp, end_timestamp)
+                compare_stats = data_process.get_window_statistics(compare_start_timestamp, compare_end_timestamp)
+                if compare_stats.empty:
+                    print('no data found in the comparison window')
+                    compare_stats = None
         else:
             print('no data found')
             break
@@ -63,6 +111,9 @@ app = Dash(title='Heatmaps', external_stylesheets=[dbc.themes.CYBORG])
 server = app.server
 app.config.suppress_callback_exceptions = True
 
+# metrics of the last rendered figure, exported on /metrics
+frame_metrics = {'frame_count': 0, 'payload_bytes': 0, 'interval_minutes': 0}
+
 controls = dbc.Card([
     html.Div([
         dbc.Label("Filter Values Greater than"),
@@ -142,6 +193,22 @@ controls = dbc.Card([
                            inputStyle={"margin-right": "10px"}
                            ),
         ]),
+        html.Div([
+            dbc.Label("Compare with the Previous Window" +
+                      (" (no data in the comparison window)" if compare_offset and compare_stats is None else "")),
+            dcc.RadioItems(id="compare_radiobutton",
+                           options=[
+                               {'label': 'None', 'value': 'none'},
+                               {'label': 'Absolute Difference', 'value': 'absolute_difference',
+                                'disabled': compare_stats is None},
+                               {'label': 'Relative Difference (%)', 'value': 'relative_difference',
+                                'disabled': compare_stats is None}],
+                           value='none',
+                           inline=True,
+                           style={"width": "60%"},
+                           inputStyle={"margin-right": "10px"}
+                           ),
+        ]),
     ])
 ], body=True,
 )
@@ -159,6 +226,7 @@ app.layout = dbc.Container(
             [
                 dbc.Col(
                     dcc.Loading([
+                        html.Div(id='frame_info', className="m-4"),
                         dcc.Graph(
                             id='graph',
                             config={'displayModeBar': True, 'toImageButtonOptions': {'height': None, 'width': None}},
@@ -190,6 +258,71 @@ def create_master_dataframe(list1, list2):
     return master_df
 
 
+# function for merging the window statistics of the selected graph type and status codes per cell
+def filter_statistics(stats_df, graph_type, status_code_list, select_all):
+    stats_df = stats_df.reset_index()
+    stats_df = stats_df[stats_df['type'] == graph_type]
+    if len(status_code_list) > 0 and len(select_all) == 0:
+        stats_df = stats_df[stats_df['status_code'].isin(status_code_list)]
+    return DataProcessing.merge_statistics(stats_df, ['row', 'col'])
+
+
+# function for creating the heatmap of the difference between the current and the comparison window
+def create_comparison_figure(graph_type, status_code_list, select_all, aggregation_type, compare_type, title_x):
+    diff = DataProcessing.compare_statistics(filter_statistics(current_stats, graph_type, status_code_list, select_all),
+                                             filter_statistics(compare_stats, graph_type, status_code_list, select_all),
+                                             aggregation_type,
+                                             relative=compare_type == 'relative_difference')
+    if diff is None or diff.empty:
+        return None
+
+    diff_df = diff.rename('result').reset_index().pivot(index='row', columns='col', values='result')
+    master_df = create_master_dataframe(diff_df.index.tolist(), diff_df.columns.tolist())
+    master_df.update(diff_df, overwrite=True)
+
+    fig = go.Figure(
+        data=[
+            go.Heatmap(z=master_df,
+                       x=master_df.columns,
+                       y=master_df.index,
+                       zmid=0,
+                       colorscale='RdBu_r')
+        ],
+        layout=go.Layout(
+            dragmode='pan',
+            autosize=True,
+            height=None,
+            width=None,
+            yaxis={"title": graph_type.split("_")[0].upper(), "dtick": 1},
+            xaxis={"title": graph_type.split("_")[1].upper(), "tickangle": -60, "side": 'top', "dtick": 1},
+            title={
+                'text': title_x,
+                'y': 0.98,
+                'x': 0.2,
+                'xanchor': 'center',
+                'yanchor': 'top',
+                'pad': {'b': 30}
+            },
+            margin=dict(
+                t=100
+            )
+        )
+    )
+    return fig
+
+
+# aggregated data for each coarsening factor, so the buckets are merged only once per factor
+coarsened_data = {}
+
+
+def get_frame_data(factor):
+    if factor <= 1:
+        return df
+    if factor not in coarsened_data:
+        coarsened_data[factor] = data_process.coarsen(df, factor)
+    return coarsened_data[factor]
+
+
 # function for filtering dataframe
 def filter_dataframe(input_df, status_code_list, select_all, value_type, input1, input2, aggregation_type):
     # check if the dataframe contains the aggregation_type else return an empty dataframe
@@ -253,6 +386,130 @@ def filter_dataframe(input_df, status_code_list, select_all, value_type, input1,
         return empty_df, 0, 0
 
 
+# function for creating the animated figure, with the buckets of every `factor` intervals merged into one frame
+def create_animation_figure(master_df, aggregated_frame, factor, graph_type, status_code_list, select_all, value_type,
+                            input1, input2, aggregation_type, range_type, title_x):
+    yaxis_name = graph_type.split("_")[0].upper()
+    xaxis_name = graph_type.split("_")[1].upper()
+
+    frames = [aggregated_frame]
+    range_values = []
+    frame_df = get_frame_data(factor)
+    frame_plot_df = frame_df[frame_df['type'] == graph_type]
+
+    # Heatmap Animation.
+    # Creating multiple dataframes from frame_plot_df for each timestamp.
+    for time_frame in sorted(frame_df['ts'].unique().tolist()):
+        temp_df = frame_plot_df.copy()
+        temp_df = temp_df[temp_df['ts'] == time_frame]
+
+        filtered_df, z_min, z_max = filter_dataframe(temp_df, status_code_list, select_all, value_type,
+                                                     input1, input2, aggregation_type)
+
+        range_values.append(z_max)
+
+        # Copying the values from the filtered df and putting it back to the master structure
+        # so that the frame remains the same
+        filtered_df = filtered_df.pivot(index='row', columns='col', values='result')
+        master_df.update(filtered_df, overwrite=True)
+
+        # Appending the individual frames to the master frames
+        if master_df is not None:
+            frames.append(
+                go.Frame(
+                    name=time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(int(time_frame) / 1000)),
+                    data=[
+                        go.Heatmap(z=master_df,
+                                   x=master_df.columns,
+                                   y=master_df.index,
+                                   zmin=z_min,
+                                   zmax=z_max)
+                    ]
+                )
+            )
+        else:
+            raise PreventUpdate
+
+    # if constant range is selected, change the zmax of the frames
+    # to the max of range_values (list of each frame's max value)
+    if range_type == 'constant_range':
+        for i, f in enumerate(frames):
+            if i > 0:  # skipping the first frame as it's the aggregated view
+                f['data'][0]['zmax'] = max(range_values)
+
+    # Figure Layout
+    fig = go.Figure(
+        data=frames[0].data,
+        frames=frames,
+        layout=go.Layout(
+            dragmode='pan',
+            autosize=True,
+            height=None,
+            width=None,
+            yaxis={"title": yaxis_name, "dtick": 1},
+            xaxis={"title": xaxis_name, "tickangle": -60, "side": 'top', "dtick": 1},
+            legend=dict(
+                itemclick="toggleothers",  # Click behavior for legend items
+                itemdoubleclick="toggle"
+            ),
+            title={
+                'text': title_x,
+                'y': 0.98,  # Move the title a bit higher to avoid overlap
+                'x': 0.2,
+                'xanchor': 'center',
+                'yanchor': 'top',
+                'pad': {'b': 30}  # Add bottom padding to the title
+            },
+            margin=dict(
+                t=100  # Add some top margin to give more space between the title and plot
+            )
+        )
+    )
+    # play-pause config
+    fig.update_layout(
+        updatemenus=[{
+            'buttons': [
+                {
+                    'args': [None, {'frame': {'duration': 500, 'redraw': True},
+                                    'transition': {'duration': 500, 'easing': 'quadratic-in-out'}}],
+                    'label': 'Play',
+                    'method': 'animate'
+                },
+                {
+                    'args': [[None], {'frame': {'duration': 0, 'redraw': False},
+                                      'mode': 'immediate',
+                                      'transition': {'duration': 0}}],
+                    'label': 'Pause',
+                    'method': 'animate'
+                }
+            ],
+            'direction': 'left',
+            'pad': {'r': 10, 't': 100},
+            'showactive': False,
+            'type': 'buttons',
+            'x': 0.1,
+            'xanchor': 'right',
+            'y': 0,
+            'yanchor': 'top'
+        }],
+        sliders=[
+            {
+                "steps": [{"args": [[f.name],
+                                    {
+                                        "frame": {"duration": 0, "redraw": True},
+                                        "mode": "immediate",
+                                    },
+                                    ],
+                           "label": f.name, "method": "animate",
+                           }
+                          for f in frames],
+            }
+        ]
+    )
+
+    return fig
+
+
 # callback for status dropdown
 @app.callback(
     Output('status_dropdown', 'value'),
@@ -288,12 +545,14 @@ def update_checklist(chosenValues, availableChoices, select_all):
 @app.callback(
     Output("value_type_radiobutton", "options"),
     [Input("status_dropdown", "value"),
-     Input("stats_dropdown", "value")],
+     Input("stats_dropdown", "value"),
+     Input("compare_radiobutton", "value")],
     [State('select-all', 'value')]
 
 )
-def update_radiobutton(selectedStatusCodes, selectedStatsType, selectedAll):
-    if not selectedStatusCodes or len(selectedAll) > 0 or selectedStatsType != 'count':
+def update_radiobutton(selectedStatusCodes, selectedStatsType, selectedCompareType, selectedAll):
+    if not selectedStatusCodes or len(selectedAll) > 0 or selectedStatsType != 'count' or \
+            selectedCompareType != 'none':
         return [
             {"label": "Value", "value": "absolute_value"},
             {"label": "Percentage", "value": "percentage_value", "disabled": True},
@@ -305,8 +564,41 @@ def update_radiobutton(selectedStatusCodes, selectedStatsType, selectedAll):
         ]
 
 
+# callback for disabling the value filters and range type, which are not used in comparison mode
+@app.callback(
+    [Output("input1", "disabled"),
+     Output("input2", "disabled"),
+     Output("range_radiobutton", "options")],
+    [Input("compare_radiobutton", "value")]
+)
+def update_comparison_controls(selectedCompareType):
+    comparing = selectedCompareType != 'none'
+    return comparing, comparing, [
+        {'label': 'Constant Range', 'value': 'constant_range', 'disabled': comparing},
+        {'label': 'Variable Range', 'value': 'variable_range', 'disabled': comparing},
+    ]
+
+
+# exporting frame-count and payload-size metrics in Prometheus text format
+@server.route('/metrics')
+def metrics():
+    lines = [
+        '# HELP heatmap_frame_count Number of animation frames in the last rendered figure.',
+        '# TYPE heatmap_frame_count gauge',
+        'heatmap_frame_count %d' % frame_metrics['frame_count'],
+        '# HELP heatmap_payload_bytes Size of the last rendered figure in bytes.',
+        '# TYPE heatmap_payload_bytes gauge',
+        'heatmap_payload_bytes %d' % frame_metrics['payload_bytes'],
+        '# HELP heatmap_interval_minutes Interval used for the frames of the last rendered figure.',
+        '# TYPE heatmap_interval_minutes gauge',
+        'heatmap_interval_minutes %d' % frame_metrics['interval_minutes'],
+    ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+
 # main function
 @app.callback(
+    Output('frame_info', 'children'),
     Output('graph', 'figure'),
     [
         Input('input1', 'value'),
@@ -315,15 +607,16 @@ def update_radiobutton(selectedStatusCodes, selectedStatsType, selectedAll):
         Input('value_type_radiobutton', 'value'),
         Input('range_radiobutton', 'value'),
         Input('stats_dropdown', 'value'),
-        Input('graph_type_dropdown', 'value')
+        Input('graph_type_dropdown', 'value'),
+        Input('compare_radiobutton', 'value')
     ],
     [
         State('select-all', 'value'),
         State('stats_dropdown', 'options')
     ]
 )
-def update_figure(input1, input2, status_code_list, value_type, range_type, aggregation_type, graph_type, select_all,
-                  agg_selection):
+def update_figure(input1, input2, status_code_list, value_type, range_type, aggregation_type, graph_type, compare_type,
+                  select_all, agg_selection):
     
     
     # filter only required graph_type and discard others
@@ -332,7 +625,6 @@ def update_figure(input1, input2, status_code_list, value_type, range_type, aggr
     # print(graph_type)
     # print(plot_df)
     frames = []
-    range_values = []
     blank_fig = go.Figure(
         data=[],
         layout=go.Layout(
@@ -349,19 +641,35 @@ def update_figure(input1, input2, status_code_list, value_type, range_type, aggr
     if type(status_code_list) == str:
         status_code_list = [status_code_list]
 
-    # x-axis and y-axis title
-    yaxis_name = graph_type.split("_")[0].upper()
-    xaxis_name = graph_type.split("_")[1].upper()
-
     aggregation_label = [x['label'] for x in agg_selection if x['value'] == aggregation_type]
     title_x = aggregation_label[0]
 
+    # comparison mode shows a single heatmap of the difference between the two windows,
+    # the value type, value filters and range type are not used
+    comparing = compare_type != 'none' and compare_stats is not None
+
     if len(status_code_list) == 0 or len(select_all) > 0:
         title_x += "(All Kinds)"
+    elif comparing:
+        title_x += "<br>(Status code(s) " + str(status_code_list) + ")"
     else:
         title_x += "<br>(Status code(s) " + str(status_code_list) + ") in " + \
                    value_type.split("_")[0] + " " + value_type.split("_")[1]
 
+    if comparing:
+        compare_label = "Absolute" if compare_type == 'absolute_difference' else "Relative (%)"
+        title_x += "<br>" + compare_label + " difference to " + str(compare_offset) + " hour(s) earlier"
+        fig = create_comparison_figure(graph_type, status_code_list, select_all, aggregation_type, compare_type,
+                                       title_x)
+        if fig is None:
+            return "Metric not found for the given data", blank_fig
+        frame_info = "Comparison: %s - %s vs %s - %s" % (
+            time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(start_timestamp / 1000)),
+            time.strftime("%H:%M:%S", time.localtime(end_timestamp / 1000)),
+            time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(compare_start_timestamp / 1000)),
+            time.strftime("%H:%M:%S", time.localtime(compare_end_timestamp / 1000)))
+        return frame_info, fig
+
     # master_df is the structure of the graph (rows and columns will be fixed)
     master_df = create_master_dataframe(plot_df['row'].tolist(), plot_df['col'].tolist())
 
@@ -387,117 +695,36 @@ def update_figure(input1, input2, status_code_list, value_type, range_type, aggr
             )
         )
 
-        # Heatmap Animation.
-        # Creating multiple dataframes from plot_df for each timestamp.
-        for time_frame in sorted(timestamp_list):
-            temp_df = plot_df.copy()
-            temp_df = temp_df[temp_df['ts'] == time_frame]
-
-            filtered_df, z_min, z_max = filter_dataframe(temp_df, status_code_list, select_all, value_type,
-                                                         input1, input2, aggregation_type)
-
-            range_values.append(z_max)
-
-            # Copying the values from the filtered df and putting it back to the master structure
-            # so that the frame remains the same
-            filtered_df = filtered_df.pivot(index='row', columns='col', values='result')
-            master_df.update(filtered_df, overwrite=True)
-
-            # Appending the individual frames to the master frames
-            if master_df is not None:
-                frames.append(
-                    go.Frame(
-                        name=time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(int(time_frame) / 1000)),
-                        data=[
-                            go.Heatmap(z=master_df,
-                                       x=master_df.columns,
-                                       y=master_df.index,
-                                       zmin=z_min,
-                                       zmax=z_max)
-                        ]
-                    )
-                )
-            else:
-                raise PreventUpdate
-
-        # if constant range is selected, change the zmax of the frames
-        # to the max of range_values (list of each frame's max value)
-        if range_type == 'constant_range':
-            for i, f in enumerate(frames):
-                if i > 0:  # skipping the first frame as it's the aggregated view
-                    f['data'][0]['zmax'] = max(range_values)
-
-        # Figure Layout
-        fig = go.Figure(
-            data=frames[0].data,
-            frames=frames,
-            layout=go.Layout(
-                dragmode='pan',
-                autosize=True,
-                height=None,
-                width=None,
-                yaxis={"title": yaxis_name, "dtick": 1},
-                xaxis={"title": xaxis_name, "tickangle": -60, "side": 'top', "dtick": 1},
-                legend=dict(
-                    itemclick="toggleothers",  # Click behavior for legend items
-                    itemdoubleclick="toggle"
-                ),
-                title={
-                    'text': title_x,
-                    'y': 0.98,  # Move the title a bit higher to avoid overlap
-                    'x': 0.2,
-                    'xanchor': 'center',
-                    'yanchor': 'top',
-                    'pad': {'b': 30}  # Add bottom padding to the title
-                },
-                margin=dict(
-                    t=100  # Add some top margin to give more space between the title and plot
-                )
-            )
-        )
-        # play-pause config
-        fig.update_layout(
-            updatemenus=[{
-                'buttons': [
-                    {
-                        'args': [None, {'frame': {'duration': 500, 'redraw': True},
-                                        'transition': {'duration': 500, 'easing': 'quadratic-in-out'}}],
-                        'label': 'Play',
-                        'method': 'animate'
-                    },
-                    {
-                        'args': [[None], {'frame': {'duration': 0, 'redraw': False},
-                                          'mode': 'immediate',
-                                          'transition': {'duration': 0}}],
-                        'label': 'Pause',
-                        'method': 'animate'
-                    }
-                ],
-                'direction': 'left',
-                'pad': {'r': 10, 't': 100},
-                'showactive': False,
-                'type': 'buttons',
-                'x': 0.1,
-                'xanchor': 'right',
-                'y': 0,
-                'yanchor': 'top'
-            }],
-            sliders=[
-                {
-                    "steps": [{"args": [[f.name],
-                                        {
-                                            "frame": {"duration": 0, "redraw": True},
-                                            "mode": "immediate",
-                                        },
-                                        ],
-                               "label": f.name, "method": "animate",
-                               }
-                              for f in frames],
-                }
-            ]
-        )
-
-        return fig
+        # Frame budget: merge buckets into a coarser interval if the animation would be too large.
+        # The first guess uses the size of the aggregated view as the size of every frame, the figure is then
+        # measured and coarsened further while it is over the payload budget.
+        frame_bytes = len(json.dumps(frames[0].to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder))
+        bucket_count = (max(timestamp_list) - min(timestamp_list)) // (time_interval * 60 * 1000) + 1
+        factor = DataProcessing.get_coarsening_factor(bucket_count, frame_bytes, max_frames, max_payload_bytes)
+        while True:
+            fig = create_animation_figure(master_df.copy(), frames[0], factor, graph_type, status_code_list,
+                                          select_all, value_type, input1, input2, aggregation_type, range_type,
+                                          title_x)
+            payload_bytes = len(fig.to_json())
+            if max_payload_bytes <= 0 or payload_bytes <= max_payload_bytes or factor >= bucket_count:
+                break
+            # all buckets merged into one frame is the coarsest interval
+            factor = min(max(factor + 1, math.ceil(factor * payload_bytes / max_payload_bytes)), bucket_count)
+
+        frame_metrics.update(frame_count=len(fig.frames), payload_bytes=payload_bytes,
+                             interval_minutes=time_interval * factor)
+        print("Frames: %s, payload: %s bytes, interval: %s min" % (len(fig.frames), payload_bytes,
+                                                                  time_interval * factor))
+
+        frame_info = "Interval: %s min" % (time_interval * factor)
+        if 0 < max_payload_bytes < payload_bytes:
+            frame_info += " (coarsened from %s min, the payload budget of %.0f KB is still exceeded)" % (
+                time_interval, max_payload_bytes / 1024)
+        elif factor > 1:
+            frame_info += " (coarsened from %s min to stay within the frame budget)" % time_interval
+        frame_info += " | Frames: %s | Payload: %.0f KB" % (len(fig.frames), payload_bytes / 1024)
+
+        return frame_info, fig
 
 
 if __name__ == '__main__':
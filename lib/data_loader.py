@@ -1,33 +1,261 @@
 import os
 import gzip
+import hashlib
+import hmac
 import json
+import time
+import http.client
+import queue
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from io import BytesIO
+from urllib.parse import urlsplit, quote
 
-def get_data(directory_path, time_frame_start, time_frame_end):
+
+class LocalSource:
+    """
+    Data source reading .json.gzip files from a local directory.
     """
-    Reads all .json.gzip files from a given directory, extracts their content,
+
+    def __init__(self, directory_path):
+        self.directory_path = directory_path
+
+    def list_files(self, time_frame_start, time_frame_end):
+        """
+        Lists the .json.gzip files of the directory.
+
+        :param time_frame_start: timeframe start time
+        :param time_frame_end: timeframe end time
+        :returns: A list of file names.
+        """
+        return [f for f in os.listdir(self.directory_path) if f.endswith('.json.gzip')]
+
+    def read_files(self, file_list):
+        """
+        Reads the given files one after another.
+
+        :param file_list: List of file names returned by list_files.
+        :returns: An iterator over the parsed content of each file.
+        """
+        for file in file_list:
+            # Construct the full path for the file and read its content
+            yield get_content(os.path.join(self.directory_path, file))
+
+
+class ObjectStoreSource:
+    """
+    Data source reading .json.gzip objects from an S3-compatible bucket over HTTP.
+
+    Objects are downloaded concurrently through a pool of keep-alive connections, with at most
+    max_in_flight requests at a time. Failed requests are retried with an exponential backoff.
+    Requests are signed with AWS Signature Version 4 when an access key is given.
+    """
+
+    def __init__(self, url, max_in_flight=8, retries=3, backoff=0.5, timeout=30, cache_dir=None,
+                 file_span=None, access_key=None, secret_key=None, session_token=None, region='us-east-1'):
+        """
+        :param url: Bucket URL in path style, optionally followed by a key prefix
+                    (e.g. http://127.0.0.1:9000/bucket/data/).
+        :param max_in_flight: Maximum number of concurrent requests (and pooled connections).
+        :param retries: Number of retries of a failed request.
+        :param backoff: Delay in seconds before the first retry, doubled on every retry.
+        :param timeout: Socket timeout in seconds.
+        :param cache_dir: Optional local directory in which downloaded objects are kept.
+        :param file_span: Optional time span of one object in milliseconds. When given, objects are
+                          assumed to be named after their first timestamp, and only the objects that
+                          can hold data of the time window are listed.
+        :param access_key: Optional access key id used to sign the requests.
+        :param secret_key: Secret access key used to sign the requests.
+        :param session_token: Optional session token of temporary credentials.
+        :param region: Region used to sign the requests.
+        """
+        parsed_url = urlsplit(url)
+        bucket, _, key_prefix = parsed_url.path.strip('/').partition('/')
+        self.host = parsed_url.netloc
+        self.bucket = bucket
+        self.key_prefix = key_prefix + '/' if key_prefix else ''
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_dir = cache_dir
+        self.file_span = file_span
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.region = region
+
+        connection_class = http.client.HTTPSConnection if parsed_url.scheme == 'https' else http.client.HTTPConnection
+        # connections are opened lazily on their first request and kept alive afterwards
+        self.pool = queue.LifoQueue()
+        for _ in range(max_in_flight):
+            self.pool.put(connection_class(parsed_url.netloc, timeout=timeout))
+
+    def request(self, path, query=None):
+        """
+        Sends a GET request using a connection from the pool, retrying on connection errors,
+        throttling (429) and server errors (5xx).
+
+        :param path: Request path (not encoded).
+        :param query: Optional dictionary of query parameters.
+        :returns: The response body.
+        """
+        path = quote(path)
+        query_string = get_query_string(query or {})
+        url = path + '?' + query_string if query_string else path
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            headers = {'host': self.host}
+            if self.access_key:
+                # signed on every attempt, as a signature is only valid for a few minutes
+                headers = sign_request('GET', self.host, path, query_string, self.access_key, self.secret_key,
+                                       self.region, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+                                       self.session_token)
+            connection = self.pool.get()
+            try:
+                connection.request('GET', url, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # closing the connection makes it reconnect on the next request
+                connection.close()
+                error = e
+                continue
+            finally:
+                self.pool.put(connection)
+
+            if response.status == 200:
+                return body
+            error = IOError(f"GET {url} returned HTTP {response.status}")
+            if response.status != 429 and response.status < 500:
+                break
+        raise error
+
+    def list_files(self, time_frame_start, time_frame_end):
+        """
+        Lists the .json.gzip objects of the bucket under the key prefix.
+
+        :param time_frame_start: timeframe start time
+        :param time_frame_end: timeframe end time
+        :returns: A list of object keys.
+        """
+        query = {'list-type': '2', 'prefix': self.key_prefix}
+        if self.file_span:
+            # the object holding the start of the time window is named up to file_span earlier
+            first_timestamp = time_frame_start - self.file_span
+            query['prefix'] += get_time_prefix(first_timestamp, time_frame_end)
+            query['start-after'] = self.key_prefix + str(first_timestamp - 1)
+
+        file_list = []
+        while True:
+            root = ElementTree.fromstring(self.request(f"/{self.bucket}", query))
+
+            # ignore the XML namespace of the ListObjectsV2 response
+            for element in root.iter():
+                element.tag = element.tag.rpartition('}')[2]
+            for key in root.iterfind('Contents/Key'):
+                if not key.text.endswith('.json.gzip'):
+                    continue
+                if self.file_span:
+                    name = key.text[len(self.key_prefix):].split('.')[0]
+                    if not name.isdigit() or int(name) < first_timestamp:
+                        continue
+                    if int(name) > time_frame_end:
+                        # keys are listed in order, so the remaining objects start after the time window
+                        return file_list
+                file_list.append(key.text)
+
+            if root.findtext('IsTruncated') != 'true':
+                return file_list
+            query['continuation-token'] = root.findtext('NextContinuationToken')
+
+    def read_files(self, file_list):
+        """
+        Downloads the given objects concurrently.
+
+        :param file_list: List of object keys returned by list_files.
+        :returns: An iterator over the parsed content of each object.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            yield from executor.map(self.get_content, file_list)
+
+    def get_content(self, key):
+        """
+        Downloads (or reads from the local cache) and parses a .json.gzip object.
+
+        :param key: Object key.
+        :returns: A dictionary containing the parsed JSON data from the object,
+                  or None if an error occurs.
+        """
+        cache_path = os.path.join(self.cache_dir, *key.split('/')) if self.cache_dir else None
+        # cached objects are assumed to never change in the bucket
+        if cache_path and os.path.exists(cache_path):
+            data = get_content(cache_path)
+            if data is not None:
+                return data
+            # an unreadable cache entry is removed and the object is downloaded again
+            os.remove(cache_path)
+
+        try:
+            raw_content = self.request(f"/{self.bucket}/{key}")
+            data = parse_content(raw_content)
+        except Exception as e:
+            print(f"Unable to retrieve object contents from {key}: {e}")
+            return None
+
+        if cache_path:
+            # write to a temporary file first so that a partial download is never read from the cache
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path + '.tmp', 'wb') as f:
+                f.write(raw_content)
+            os.replace(cache_path + '.tmp', cache_path)
+        return data
+
+
+def get_data(source, time_frame_start, time_frame_end):
+    """
+    Reads all .json.gzip files from a data source, extracts their content,
     and merges the data into a single dictionary.
 
-    :param directory_path: Path to the directory containing .json.gzip files.
+    :param source: Path to the directory containing .json.gzip files, or a data source
+                   (LocalSource or ObjectStoreSource).
     :returns: A dictionary containing the merged content from all files.
     """
+    return get_windows_data(source, [(time_frame_start, time_frame_end)])
+
+def get_windows_data(source, windows):
+    """
+    Reads the .json.gzip files of several time windows from a data source, and merges
+    the items inside the windows into a single dictionary. Files shared by the windows
+    are only read once.
+
+    :param source: Path to the directory containing .json.gzip files, or a data source
+                   (LocalSource or ObjectStoreSource).
+    :param windows: List of (start, end) timestamps.
+    :returns: A dictionary containing the merged items of all windows.
+    """
+    if isinstance(source, str):
+        source = LocalSource(source)
+
     data_array = {}  # Dictionary to hold all data combined from multiple files
     
-    # Get a list of .json.gzip files from the directory
-    file_list = [f for f in os.listdir(directory_path) if f.endswith('.json.gzip')]
+    # Get a list of .json.gzip files of each window from the source
+    # dict keeps the order of the files without duplicates
+    file_list = {}
+    for time_frame_start, time_frame_end in windows:
+        file_list.update(dict.fromkeys(source.list_files(time_frame_start, time_frame_end)))
     
-    # Iterate through each file in the directory
-    for file in file_list:
-        # Construct the full path for the file
-        file_path = os.path.join(directory_path, file)
-        
-        # Read the content of the file
-        data_received = get_content(file_path)
-        
-        # check whether the timestamp keys inside the files are in the range
-        for items in data_received:
-            if is_item_in_time_range(items, time_frame_start, time_frame_end):
-                data_array.update(data_received)
+    # Iterate through the content of each file
+    for data_received in source.read_files(list(file_list)):
+        if data_received is None:
+            continue
+
+        # only keep the timestamp keys inside the files that are in one of the windows
+        data_array.update({items: data_received[items] for items in data_received
+                           if any(is_item_in_time_range(items, start, end) for start, end in windows)})
 
     return data_array
 
@@ -40,18 +268,84 @@ def get_content(file_path):
               or None if an error occurs.
     """
     try:
-        # Open and decompress the .json.gzip file
-        with gzip.open(file_path, 'rb') as f:
-            # Read the raw content of the gzip file
-            content = f.read()
-            
-            # Parse the raw content as JSON and return as a Python dictionary
-            data = json.loads(content)
-            return data
+        # Read the raw content of the gzip file
+        with open(file_path, 'rb') as f:
+            return parse_content(f.read())
     except Exception as e:
         # Handle and print any exceptions that occur during file reading
         print(f"Unable to retrieve file contents from {file_path}: {e}")
         return None  # Return None if an error occurs
+
+def parse_content(raw_content):
+    """
+    Decompresses and parses the raw content of a .json.gzip file.
+
+    :param raw_content: Compressed bytes of the file.
+    :returns: A dictionary containing the parsed JSON data.
+    """
+    # Decompress the content
+    with gzip.GzipFile(fileobj=BytesIO(raw_content)) as f:
+        content = f.read()
+
+    # Parse the raw content as JSON and return as a Python dictionary
+    return json.loads(content)
+
+def get_query_string(query):
+    """
+    Encodes query parameters in the canonical form of AWS Signature Version 4 (sorted by name).
+    :param query: dictionary of query parameters
+    :returns: The encoded query string
+    """
+    return '&'.join(f"{quote(str(k), safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(query.items()))
+
+def sign_request(method, host, path, query_string, access_key, secret_key, region, amz_date, session_token=None):
+    """
+    Signs a request without a body with AWS Signature Version 4 for the s3 service.
+    :param method: HTTP method
+    :param host: value of the Host header
+    :param path: encoded request path
+    :param query_string: query string returned by get_query_string
+    :param access_key: access key id
+    :param secret_key: secret access key
+    :param region: region of the bucket
+    :param amz_date: request time in the format YYYYMMDDTHHMMSSZ
+    :param session_token: optional session token of temporary credentials
+    :returns: A dictionary of the headers to send, including the Authorization header
+    """
+    payload_hash = hashlib.sha256(b'').hexdigest()
+    headers = {'host': host, 'x-amz-content-sha256': payload_hash, 'x-amz-date': amz_date}
+    if session_token:
+        headers['x-amz-security-token'] = session_token
+    signed_headers = ';'.join(sorted(headers))
+    canonical_headers = ''.join(f"{k}:{headers[k]}\n" for k in sorted(headers))
+    canonical_request = '\n'.join([method, path, query_string, canonical_headers, signed_headers, payload_hash])
+
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+    # the signing key is derived from the secret key, the date, the region and the service
+    signing_key = ('AWS4' + secret_key).encode()
+    for part in [amz_date[:8], region, 's3', 'aws4_request']:
+        signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                                f"SignedHeaders={signed_headers}, Signature={signature}")
+    return headers
+
+def get_time_prefix(time_frame_start, time_frame_end):
+    """
+    Returns the leading digits shared by the start and end timestamps, which every
+    timestamp in between also starts with.
+    :param time_frame_start: timeframe start time
+    :param time_frame_end: timeframe end time
+    :returns: The common prefix, or an empty string if the timestamps differ in length
+    """
+    start, end = str(time_frame_start), str(time_frame_end)
+    if len(start) != len(end):
+        return ''
+    return os.path.commonprefix([start, end])
     
 def is_item_in_time_range(item, time_frame_start, time_frame_end):
     """
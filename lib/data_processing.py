@@ -1,14 +1,18 @@
+import math
 import time
 import pandas as pd
 import numpy as np
 
 
 class DataProcessing:
-    def __init__(self, data, interval, start_time, end_time):
+    def __init__(self, data, interval, start_time, end_time, extra_windows=()):
         self.data = data
         self.interval = interval
         self.start_time = start_time
         self.end_time = end_time
+        # other (start, end) time windows used with get_window_statistics, e.g. for comparisons
+        self.windows = [(start_time, end_time)] + list(extra_windows)
+        self.pivot_df = None
 
     @staticmethod
     def aggregation_functions(x):
@@ -62,47 +66,166 @@ class DataProcessing:
         s = pd.Series(d)
         return s
 
-    @property
-    def get_aggregated_data(self):
-        print("Getting aggregated data")
-        start_time = time.time()
-        try:
-            df = pd.DataFrame()
-            for i in self.data:
-                content = self.data[i]
-                temp_df = pd.json_normalize(content, sep="/")
-                temp_df.insert(0, 'ts', int(i))
-                df = pd.concat([df, temp_df], ignore_index=True)
+    @staticmethod
+    def get_sufficient_statistics(x):
+        """
+        Add the sum and the sum of squares of the response times to each row, so that rows can be merged
+        by adding up columns instead of applying the pairwise formulas of aggregation_functions.
+        :param x: dataframe with count and (optionally) avg, std, max, min columns
+        :returns: dataframe with count, sum, sum_sq, max, min columns (as available)
+        """
+        d = pd.DataFrame(x['count'])
+        if 'avg' in x.columns:
+            d['sum'] = x['count'] * x['avg']
+        if 'avg' in x.columns and 'std' in x.columns:
+            # sum of squares = (n-1)s^2 + nx^2
+            d['sum_sq'] = (x['count'] - 1).clip(lower=0) * np.square(x['std']) + x['count'] * np.square(x['avg'])
+        for column in ['max', 'min']:
+            if column in x.columns:
+                d[column] = x[column]
+        return d
 
-            # only take the subset for a time window
-            filter_df = df.loc[(df['ts'] >= self.start_time) & (df['ts'] <= self.end_time)].set_index('ts')
+    @staticmethod
+    def merge_statistics(x, keys):
+        """
+        Merge the sufficient statistics of all rows sharing the same keys.
+        :param x: dataframe returned by get_sufficient_statistics (with the key columns)
+        :param keys: list of columns to group by
+        :returns: merged dataframe indexed by keys
+        """
+        functions = {'count': 'sum', 'sum': 'sum', 'sum_sq': 'sum', 'max': 'max', 'min': 'min'}
+        return x.groupby(keys).agg({k: v for k, v in functions.items() if k in x.columns})
+
+    @staticmethod
+    def get_metric(x, metric):
+        """
+        Compute a metric from merged sufficient statistics.
+        :param x: dataframe returned by merge_statistics
+        :param metric: one of count, avg, std, max, min
+        :returns: series of metric values, or None if the metric is not available
+        """
+        count = x['count']
+        if metric == 'count':
+            return count
+        if metric == 'avg' and 'sum' in x.columns:
+            return (x['sum'] / count.where(count != 0)).fillna(0)
+        if metric == 'std' and 'sum_sq' in x.columns:
+            # combined sample variance = (sum of squares - (sum)^2 / n) / (n-1)
+            variance = (x['sum_sq'] - np.square(x['sum']) / count.where(count != 0)) / (count - 1).where(count > 1)
+            return np.sqrt(variance.clip(lower=0)).fillna(0)
+        if metric in ['max', 'min'] and metric in x.columns:
+            return x[metric]
+        return None
 
-            temp_dict = {str(k): {tuple(k1.split('/')): v1 for k1, v1 in v.items()} for k, v in
-                         filter_df.to_dict('index').items()}
+    @staticmethod
+    def compare_statistics(x, y, metric, relative=False):
+        """
+        Compute the difference of a metric between two sets of merged sufficient statistics.
+        :param x: dataframe returned by merge_statistics for the current window
+        :param y: dataframe returned by merge_statistics for the comparison window (same keys)
+        :param metric: one of count, avg, std, max, min
+        :param relative: return the difference as a percentage of the comparison window
+        :returns: series of differences indexed by the union of both keys, or None if the metric is not available.
+                  Cells without calls in either window have no difference (NaN), except for count.
+        """
+        index = x.index.union(y.index)
+        x = x.reindex(index, fill_value=0)
+        y = y.reindex(index, fill_value=0)
+        x_metric = DataProcessing.get_metric(x, metric)
+        y_metric = DataProcessing.get_metric(y, metric)
+        if x_metric is None or y_metric is None:
+            return None
 
-            tuples = []
-            for k, v in temp_dict.items():
-                for tuple_k, value in v.items():
-                    if len(tuple_k) == 5:
-                        tuples.append((k, tuple_k[0], tuple_k[1], tuple_k[2], tuple_k[3], tuple_k[4], value))
-                    else:
-                        tuples.append((k, tuple_k[0], tuple_k[1], tuple_k[2], tuple_k[3], 'count', value))
+        diff = x_metric - y_metric
+        if metric != 'count':
+            diff = diff.where((x['count'] > 0) & (y['count'] > 0))
+        if relative:
+            # cells without a value in the comparison window have no relative difference
+            diff = diff / y_metric.where(y_metric != 0) * 100
+        return diff
+
+    def get_pivot_data(self):
+        """
+        Parse the data of the time windows into one row per timestamp, type, row, col and status code.
+        The result is kept, so several time windows can be taken from the same data.
+        :returns: dataframe indexed by date_time with one column per stats
+        """
+        if self.pivot_df is not None:
+            return self.pivot_df
+
+        df = pd.DataFrame()
+        for i in self.data:
+            # only parse the timestamps inside the time windows
+            if not any(start <= int(i) <= end for start, end in self.windows):
+                continue
+            content = self.data[i]
+            temp_df = pd.json_normalize(content, sep="/")
+            temp_df.insert(0, 'ts', int(i))
+            df = pd.concat([df, temp_df], ignore_index=True)
+
+        filter_df = df.set_index('ts')
+
+        temp_dict = {str(k): {tuple(k1.split('/')): v1 for k1, v1 in v.items()} for k, v in
+                     filter_df.to_dict('index').items()}
+
+        tuples = []
+        for k, v in temp_dict.items():
+            for tuple_k, value in v.items():
+                if len(tuple_k) == 5:
+                    tuples.append((k, tuple_k[0], tuple_k[1], tuple_k[2], tuple_k[3], tuple_k[4], value))
+                else:
+                    tuples.append((k, tuple_k[0], tuple_k[1], tuple_k[2], tuple_k[3], 'count', value))
+
+        new_df = pd.DataFrame(tuples, columns=['ts', 'type', 'row', 'col', 'status_code', 'stats', 'value'])
+        new_df.insert(column='date_time', loc=1, value=pd.to_datetime(new_df['ts'], unit='ms'))
+        new_df['date_time'] = new_df['date_time'].dt.tz_localize('utc').dt.tz_convert('Canada/Eastern')
+        new_df.reset_index()
 
-            new_df = pd.DataFrame(tuples, columns=['ts', 'type', 'row', 'col', 'status_code', 'stats', 'value'])
-            new_df.insert(column='date_time', loc=1, value=pd.to_datetime(new_df['ts'], unit='ms'))
-            new_df['date_time'] = new_df['date_time'].dt.tz_localize('utc').dt.tz_convert('Canada/Eastern')
-            new_df.reset_index()
+        pivot_df = new_df.pivot(index=['date_time', 'type', 'row', 'col', 'status_code'],
+                                columns='stats',
+                                values='value')
+        pivot_df = pivot_df.reset_index(level=[1, 2, 3, 4]).rename_axis([None], axis='columns')
 
-            pivot_df = new_df.pivot(index=['date_time', 'type', 'row', 'col', 'status_code'],
-                                    columns='stats',
-                                    values='value')
-            pivot_df = pivot_df.reset_index(level=[1, 2, 3, 4]).rename_axis([None], axis='columns')
+        pivot_df.fillna(0, inplace=True)
 
-            pivot_df.fillna(0, inplace=True)
+        if pivot_df.columns.str.contains('std').any():
+            # setting std as 0 if count= 1
+            pivot_df.loc[pivot_df['count'] == 1, 'std'] = 0
 
-            if pivot_df.columns.str.contains('std').any():
-                # setting std as 0 if count= 1
-                pivot_df.loc[pivot_df['count'] == 1, 'std'] = 0
+        self.pivot_df = pivot_df
+        return pivot_df
+
+    def get_window_data(self, start_time, end_time):
+        """
+        Take the subset of the parsed data for a time window.
+        :param start_time: window start time (milliseconds since epoch)
+        :param end_time: window end time (milliseconds since epoch)
+        :returns: dataframe returned by get_pivot_data for the time window
+        """
+        pivot_df = self.get_pivot_data()
+        start_date_time = pd.Timestamp(start_time, unit='ms', tz='utc')
+        end_date_time = pd.Timestamp(end_time, unit='ms', tz='utc')
+        return pivot_df[(pivot_df.index >= start_date_time) & (pivot_df.index <= end_date_time)]
+
+    def get_window_statistics(self, start_time, end_time):
+        """
+        Merge the sufficient statistics of a whole time window for every type, row, col and status code.
+        :param start_time: window start time (milliseconds since epoch)
+        :param end_time: window end time (milliseconds since epoch)
+        :returns: dataframe returned by merge_statistics
+        """
+        keys = ['type', 'row', 'col', 'status_code']
+        window_df = self.get_window_data(start_time, end_time).reset_index(drop=True)
+        stats_df = pd.concat([window_df[keys], self.get_sufficient_statistics(window_df)], axis=1)
+        return self.merge_statistics(stats_df, keys)
+
+    @property
+    def get_aggregated_data(self):
+        print("Getting aggregated data")
+        start_time = time.time()
+        try:
+            # only take the subset for a time window
+            pivot_df = self.get_window_data(self.start_time, self.end_time)
 
             # pd.Grouper works faster than resample and group by
             agg_df = pivot_df.groupby([
@@ -124,3 +247,56 @@ class DataProcessing:
 
         except Exception as e:
             print(e)
+
+    @staticmethod
+    def get_coarsening_factor(bucket_count, frame_bytes, max_frames, max_payload_bytes):
+        """
+        Find how many buckets have to be merged into one frame to stay within the frame budget.
+        Both limits count the aggregated view as a frame.
+        :param bucket_count: number of buckets of the time window
+        :param frame_bytes: size of one frame in bytes (0 if unknown)
+        :param max_frames: maximum number of frames (0 disables the limit)
+        :param max_payload_bytes: maximum size of the figure in bytes (0 disables the limit)
+        :returns: number of buckets to merge into one, between 1 and bucket_count
+        """
+        frames_allowed = bucket_count
+        if max_frames > 0:
+            frames_allowed = min(frames_allowed, max_frames - 1)
+        if max_payload_bytes > 0 and frame_bytes > 0:
+            # first guess only: the figure data repeats the aggregated view, and each frame adds a slider step
+            frames_allowed = min(frames_allowed, max_payload_bytes // frame_bytes - 2)
+        return min(math.ceil(bucket_count / max(frames_allowed, 1)), max(bucket_count, 1))
+
+    def coarsen(self, agg_df, factor):
+        """
+        Merge every `factor` consecutive buckets of already aggregated data into one bucket.
+        The buckets are merged with their sufficient statistics, so the raw data is not read again.
+        :param agg_df: dataframe returned by get_aggregated_data
+        :param factor: number of buckets to merge into one
+        :returns: aggregated dataframe with an interval of (interval * factor) minutes
+        """
+        if factor <= 1:
+            return agg_df
+
+        keys = ['type', 'row', 'col', 'status_code']
+        step_ms = self.interval * factor * 60 * 1000
+        end_ts = agg_df['ts'].max()
+
+        # buckets are anchored to the end of the time window, same as pd.Grouper(origin="end")
+        agg_df = agg_df.reset_index(drop=True)
+        stats_df = pd.concat([agg_df[keys], self.get_sufficient_statistics(agg_df)], axis=1)
+        stats_df.insert(0, 'bucket', (end_ts - agg_df['ts']) // step_ms)
+        stats_df = self.merge_statistics(stats_df, ['bucket'] + keys)
+
+        coarse_df = pd.DataFrame(index=stats_df.index)
+        for column in agg_df.columns.difference(['ts'] + keys):
+            coarse_df[column] = self.get_metric(stats_df, column)
+        coarse_df['count'] = coarse_df['count'].astype(int)
+        coarse_df = coarse_df.reset_index(level=[0, 1, 2, 3, 4])
+
+        # label each merged bucket with the end of its last original bucket, same as pd.Grouper(origin="end")
+        ts_series = end_ts - coarse_df['bucket'].values * step_ms
+        coarse_df = coarse_df.drop(['bucket'], axis=1)
+        coarse_df.insert(loc=1, column='ts', value=ts_series)
+
+        return coarse_df
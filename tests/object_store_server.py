@@ -0,0 +1,103 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+
+class ObjectStoreServer:
+    """
+    Local stand-in for an S3-compatible bucket, serving ListObjectsV2 and GET object requests
+    from a dictionary of objects.
+    """
+
+    def __init__(self, bucket, objects, page_size=1000, failures=0, delay=0):
+        """
+        :param bucket: Bucket name.
+        :param objects: Dictionary of object keys and contents (bytes).
+        :param page_size: Maximum number of keys in one listing page.
+        :param failures: Number of GET object requests answered with HTTP 503 before succeeding.
+        :param delay: Delay in seconds before answering a GET object request.
+        """
+        self.bucket = bucket
+        self.objects = objects
+        self.page_size = page_size
+        self.failures = failures
+        self.delay = delay
+        self.requests = []  # (path, headers) of every request
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.create_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/{self.bucket}/"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def list_objects(self, query):
+        keys = sorted(k for k in self.objects if k.startswith(query.get('prefix', '')))
+        keys = [k for k in keys if k > query.get('start-after', '')]
+        start = int(query.get('continuation-token', 0))
+        page = keys[start:start + self.page_size]
+        truncated = start + self.page_size < len(keys)
+
+        body = '<?xml version="1.0" encoding="UTF-8"?>'
+        body += '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+        body += ''.join(f"<Contents><Key>{escape(k)}</Key></Contents>" for k in page)
+        body += f"<IsTruncated>{str(truncated).lower()}</IsTruncated>"
+        if truncated:
+            body += f"<NextContinuationToken>{start + self.page_size}</NextContinuationToken>"
+        body += '</ListBucketResult>'
+        return 200, body.encode()
+
+    def get_object(self, key):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failure = self.failures > 0
+            self.failures -= failure
+        try:
+            threading.Event().wait(self.delay)
+            if failure:
+                return 503, b'SlowDown'
+            if key not in self.objects:
+                return 404, b'NoSuchKey'
+            return 200, self.objects[key]
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def create_handler(self):
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                store.requests.append((self.path, dict(self.headers)))
+                parsed_path = urlsplit(self.path)
+                bucket, _, key = unquote(parsed_path.path).lstrip('/').partition('/')
+                if bucket != store.bucket:
+                    status, body = 404, b'NoSuchBucket'
+                elif key:
+                    status, body = store.get_object(key)
+                else:
+                    status, body = store.list_objects({k: v[0] for k, v in parse_qs(parsed_path.query).items()})
+
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
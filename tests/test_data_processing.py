@@ -0,0 +1,125 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.data_processing import DataProcessing
+
+MINUTE = 60 * 1000
+START = 1735722000000  # January 1, 2025, 09:00:00 UTC
+KEYS = ['type', 'ts', 'row', 'col', 'status_code']
+
+
+def create_data(minutes, seed=0):
+    """
+    Create one item per minute with at least 2 calls per cell, and keep the raw response times.
+    """
+    generator = random.Random(seed)
+    data = {}
+    samples = {}
+    for minute in range(minutes):
+        ts = START + minute * MINUTE
+        cells = {}
+        for row in ['dc1', 'dc2']:
+            for col in ['svc1', 'svc2']:
+                for status_code in ['200', '500']:
+                    values = [generator.gauss(100, 20) for _ in range(generator.randint(2, 5))]
+                    samples[(minute, row, col, status_code)] = values
+                    cells.setdefault(row, {}).setdefault(col, {})[status_code] = {
+                        'count': len(values), 'avg': float(np.mean(values)), 'std': float(np.std(values, ddof=1)),
+                        'max': max(values), 'min': min(values)}
+        data[str(ts)] = {'datacenter_services': cells}
+    return data, samples
+
+
+@pytest.fixture(scope='module')
+def hour_data():
+    return create_data(60)
+
+
+def test_coarsen_matches_direct_aggregation(hour_data):
+    data, _ = hour_data
+    end = START + 60 * MINUTE - 1
+    df_5 = DataProcessing(data, 5, START, end).get_aggregated_data
+    df_15 = DataProcessing(data, 15, START, end).get_aggregated_data
+
+    coarse_df = DataProcessing(data, 5, START, end).coarsen(df_5, 3)
+
+    assert sorted(coarse_df['ts'].unique()) == sorted(df_15['ts'].unique())
+    merged = coarse_df.merge(df_15, on=KEYS, suffixes=('_coarse', '_direct'))
+    assert len(merged) == len(df_15) == len(coarse_df)
+    assert (merged['count_coarse'] == merged['count_direct']).all()
+    for column in ['avg', 'std', 'max', 'min']:
+        np.testing.assert_allclose(merged[column + '_coarse'], merged[column + '_direct'])
+
+
+@pytest.mark.parametrize('factor', [0, 1])
+def test_coarsen_without_merging(hour_data, factor):
+    data, _ = hour_data
+    data_process = DataProcessing(data, 5, START, START + 60 * MINUTE - 1)
+    agg_df = data_process.get_aggregated_data
+    assert data_process.coarsen(agg_df, factor) is agg_df
+
+
+@pytest.mark.parametrize('bucket_count, frame_bytes, max_frames, max_payload_bytes, factor', [
+    (180, 1000, 0, 0, 1),  # both limits disabled
+    (180, 1000, 200, 0, 1),  # within the frame limit
+    (180, 1000, 13, 0, 15),  # 12 frames besides the aggregated view
+    (180, 1000, 1, 0, 180),  # only the aggregated view fits, all buckets are merged into one frame
+    (180, 1000, 0, 32000, 6),  # 30 frames besides the aggregated view and the figure data
+    (180, 1000, 0, 100, 180),  # the payload limit cannot be met, the factor is capped at the bucket count
+    (180, 0, 0, 32000, 1),  # unknown frame size
+])
+def test_get_coarsening_factor(bucket_count, frame_bytes, max_frames, max_payload_bytes, factor):
+    assert DataProcessing.get_coarsening_factor(bucket_count, frame_bytes, max_frames, max_payload_bytes) == factor
+
+
+def test_window_statistics_match_raw_data(hour_data):
+    data, samples = hour_data
+    data_process = DataProcessing(data, 5, START, START + 60 * MINUTE - 1)
+
+    # window of minutes 10 to 39, merged over the status codes
+    stats_df = data_process.get_window_statistics(START + 10 * MINUTE, START + 40 * MINUTE - 1)
+    stats_df = DataProcessing.merge_statistics(stats_df.reset_index(), ['row', 'col'])
+
+    for (row, col), cell in stats_df.iterrows():
+        values = [v for (minute, r, c, _), cell_values in samples.items()
+                  if r == row and c == col and 10 <= minute < 40 for v in cell_values]
+        cell_df = cell.to_frame().T
+        assert DataProcessing.get_metric(cell_df, 'count').iloc[0] == len(values)
+        assert DataProcessing.get_metric(cell_df, 'avg').iloc[0] == pytest.approx(np.mean(values))
+        assert DataProcessing.get_metric(cell_df, 'std').iloc[0] == pytest.approx(np.std(values, ddof=1))
+        assert DataProcessing.get_metric(cell_df, 'max').iloc[0] == pytest.approx(max(values))
+        assert DataProcessing.get_metric(cell_df, 'min').iloc[0] == pytest.approx(min(values))
+
+
+def create_statistics(cells):
+    stats_df = pd.DataFrame(cells, columns=['row', 'col', 'count', 'avg', 'std', 'max', 'min'])
+    stats_df = pd.concat([stats_df[['row', 'col']], DataProcessing.get_sufficient_statistics(stats_df)], axis=1)
+    return DataProcessing.merge_statistics(stats_df, ['row', 'col'])
+
+
+def test_compare_statistics():
+    current = create_statistics([('dc1', 'svc1', 10, 30, 2, 40, 20), ('dc1', 'svc2', 4, 20, 1, 22, 18)])
+    previous = create_statistics([('dc1', 'svc1', 5, 20, 2, 30, 10), ('dc2', 'svc1', 3, 50, 0, 50, 50)])
+
+    count = DataProcessing.compare_statistics(current, previous, 'count')
+    assert count.to_dict() == {('dc1', 'svc1'): 5, ('dc1', 'svc2'): 4, ('dc2', 'svc1'): -3}
+
+    avg = DataProcessing.compare_statistics(current, previous, 'avg', relative=True)
+    assert avg[('dc1', 'svc1')] == pytest.approx(50)
+
+
+@pytest.mark.parametrize('metric', ['avg', 'std', 'max', 'min'])
+@pytest.mark.parametrize('relative', [False, True])
+def test_compare_statistics_missing_cells(metric, relative):
+    # dc1/svc2 only has calls in the current window, dc2/svc1 only in the previous window
+    current = create_statistics([('dc1', 'svc1', 10, 30, 2, 40, 20), ('dc1', 'svc2', 4, 20, 1, 22, 18),
+                                 ('dc2', 'svc1', 0, 0, 0, 0, 0)])
+    previous = create_statistics([('dc1', 'svc1', 5, 20, 2, 30, 10), ('dc2', 'svc1', 3, 50, 0, 50, 50)])
+
+    diff = DataProcessing.compare_statistics(current, previous, metric, relative=relative)
+    assert not np.isnan(diff[('dc1', 'svc1')])
+    assert np.isnan(diff[('dc1', 'svc2')])
+    assert np.isnan(diff[('dc2', 'svc1')])